@@ -3,11 +3,22 @@ import sys
 import os
 import random
 import math
+import time
+import threading
+import subprocess
+from bisect import bisect_left
+from collections import deque
+import chunk_library
+import level_thumbnails
+import spectator_server
 
 # --- Constants ---
 SCREEN_WIDTH = 1024
 SCREEN_HEIGHT = 600
 FPS = 60
+IDLE_WAIT_MS = 1000
+AUTOSAVE_INTERVAL_MS = 30000
+SAVE_BATCH_SIZE = 500 # objects serialized between GIL hand-backs to the editor
 GRID_SIZE = 20
 
 # --- Colors ---
@@ -29,6 +40,7 @@ GOAL_COLOR = (255, 255, 0, 150)
 SPIKE_COLOR = (100, 100, 100)
 CHECKPOINT_COLOR = (100, 255, 100, 150)
 CHECKPOINT_ACTIVE_COLOR = (200, 255, 200, 200)
+SPRITE_COLORKEY = (255, 0, 255) # Transparent background of pre-rasterized shape sprites
 
 # --- Physics ---
 GRAVITY = 0.5
@@ -36,6 +48,12 @@ JUMP_STRENGTH = -11
 TRAMPOLINE_BOUNCE = -20
 COYOTE_TIME_FRAMES = 4
 Z_JUMP_HEIGHT = 10
+PUSHABLE_SLEEP_FRAMES = 30
+BROADPHASE_CELL_SIZE = 100
+WIDE_ITEM_WIDTH = 400
+REWIND_SECONDS = 5
+REWIND_KEYFRAME_INTERVAL = 30
+REWIND_SCRUB_TICKS = 2
 
 # --- Game States ---
 MENU, LEVEL_EDITOR, LEVEL_SELECT, PLAYING, PLAYING_INFINITE = "menu", "level_editor", "level_select", "playing", "playing_infinite"
@@ -99,25 +117,40 @@ class TextInputBox:
         self.rect.w = max(200, text_surface.get_width() + 10)
 
 # --- Game Object Classes ---
+# Objects use __slots__ so 100k-object levels in the editor don't carry a dict per instance.
+# Colors are references to the shared constants above and types are interned, so neither is duplicated per object.
 class GameObject:
+    __slots__ = ("rect", "color", "type")
     def __init__(self, x, y, w, h, color, obj_type="platform"):
         self.rect = pygame.Rect(x, y, w, h)
         self.color = color
-        self.type = obj_type
+        self.type = sys.intern(obj_type)
     def draw(self, screen, camera):
         pygame.draw.rect(screen, self.color, camera.apply(self))
 
 class PushableObject(GameObject):
+    __slots__ = ("is_static", "is_sleeping", "sleep_timer")
     def __init__(self, x, y, w, h, color):
         super().__init__(x, y, w, h, color, obj_type="pushable")
         self.is_static = True
+        self.is_sleeping = True
+        self.sleep_timer = 0
+    def wake(self):
+        self.is_sleeping = False
+        self.sleep_timer = PUSHABLE_SLEEP_FRAMES
 
 class Slope(GameObject):
+    __slots__ = ("left_top", "right_top", "start_y", "gradient")
     def __init__(self, x, y, w, h, color, left_top, right_top):
         super().__init__(x, y, w, h, color, obj_type="slope")
         self.left_top = left_top
         self.right_top = right_top
-        self.poly = [
+        # Surface line y = start_y + gradient * (x - rect.left), computed once instead of on every query
+        self.start_y = self.rect.top + left_top
+        self.gradient = (right_top - left_top) / w if w else 0
+    @property
+    def poly(self):
+        return [
             (self.rect.left, self.rect.top + self.left_top),
             (self.rect.right, self.rect.top + self.right_top),
             (self.rect.right, self.rect.bottom),
@@ -127,13 +160,265 @@ class Slope(GameObject):
         poly_points = [(p[0] + camera.camera.x, p[1] + camera.camera.y) for p in self.poly]
         pygame.draw.polygon(screen, self.color, poly_points)
     def get_y_at_x(self, x):
-        start_x, start_y = self.rect.left, self.rect.top + self.left_top
-        end_x, end_y = self.rect.right, self.rect.top + self.right_top
-        if start_x == end_x: return start_y
-        return start_y + (end_y - start_y) * ((x - start_x) / (end_x - start_x))
+        return self.start_y + self.gradient * (x - self.rect.left)
+
+# --- Broadphase ---
+# Uniform grid keyed by (cell_x, cell_y). Items are any hashable key; the rect they were indexed with is kept in self.rects.
+class SpatialGrid:
+    __slots__ = ("cell_size", "cells", "rects")
+    def __init__(self, cell_size=BROADPHASE_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+    def cell_keys(self, rect):
+        cs = self.cell_size
+        for cx in range(rect.left // cs, (rect.right - 1) // cs + 1):
+            for cy in range(rect.top // cs, (rect.bottom - 1) // cs + 1):
+                yield (cx, cy)
+    def insert(self, item, rect):
+        self.rects[item] = pygame.Rect(rect)
+        for key in self.cell_keys(rect): self.cells.setdefault(key, []).append(item)
+    def remove(self, item):
+        rect = self.rects.pop(item)
+        for key in self.cell_keys(rect):
+            cell = self.cells[key]
+            cell.remove(item)
+            if not cell: del self.cells[key]
+    def move(self, item, rect):
+        self.remove(item)
+        self.insert(item, rect)
+    def query(self, rect):
+        found = {}
+        for key in self.cell_keys(rect):
+            for item in self.cells.get(key, ()):
+                if item not in found and self.rects[item].colliderect(rect): found[item] = True
+        return list(found)
+    def collides(self, rect):
+        for key in self.cell_keys(rect):
+            for item in self.cells.get(key, ()):
+                if self.rects[item].colliderect(rect): return True
+        return False
+
+# --- Interval Index ---
+# Items sorted by rect.left. Anything overlapping [left, right) starts at or after left - max_width, so a query is a bisect plus a short scan.
+# Items wider than WIDE_ITEM_WIDTH (ground strips) are kept aside so they don't widen that scan for everything else.
+class IntervalIndex:
+    __slots__ = ("lefts", "entries", "wide", "max_width")
+    def __init__(self, entries=()):
+        # One stable sort keeps items with equal lefts in the order given, same as inserting them one by one
+        entries = sorted(entries, key=lambda e: e[0].left)
+        self.wide = [e for e in entries if e[0].width > WIDE_ITEM_WIDTH]
+        self.entries = [e for e in entries if e[0].width <= WIDE_ITEM_WIDTH]
+        self.lefts = [e[0].left for e in self.entries]
+        self.max_width = max((e[0].width for e in self.entries), default=0)
+    def insert(self, rect, item):
+        if rect.width > WIDE_ITEM_WIDTH:
+            self.wide.append((rect, item))
+            return
+        i = bisect_left(self.lefts, rect.left)
+        while i < len(self.lefts) and self.lefts[i] == rect.left: i += 1
+        self.lefts.insert(i, rect.left)
+        self.entries.insert(i, (rect, item))
+        self.max_width = max(self.max_width, rect.width)
+    def remove(self, rect):
+        # Removes the entry indexed with this exact rect object; max_width is left as is, which only makes queries scan a little further
+        if rect.width > WIDE_ITEM_WIDTH:
+            self.wide = [e for e in self.wide if e[0] is not rect]
+            return
+        i = bisect_left(self.lefts, rect.left)
+        while i < len(self.lefts) and self.lefts[i] == rect.left:
+            if self.entries[i][0] is rect:
+                del self.lefts[i], self.entries[i]
+                return
+            i += 1
+    def query(self, left, right):
+        lo = bisect_left(self.lefts, left - self.max_width)
+        hi = bisect_left(self.lefts, right)
+        found = [e for e in self.entries[lo:hi] if e[0].right > left]
+        if self.wide: found += [e for e in self.wide if e[0].left < right and e[0].right > left]
+        return found
+    def __len__(self):
+        return len(self.entries) + len(self.wide)
+
+# --- Slopes ---
+# Slopes indexed by x so the surface under a point is a bisect away. Chained runs and terrain built from many short segments
+# just become more entries; only the few segments spanning the query x are ever looked at.
+class SlopeIndex:
+    def __init__(self, slopes):
+        self.index = IntervalIndex([(slope.rect, slope) for slope in slopes])
+    def insert(self, slope):
+        self.index.insert(slope.rect, slope)
+    def remove(self, slope):
+        self.index.remove(slope.rect)
+    def at(self, x):
+        return [slope for rect, slope in self.index.query(x - 1, x + 1) if 0 <= x - rect.left <= rect.width]
+    def surface_at(self, rect):
+        # Highest slope surface under rect.centerx that rect overlaps and has sunk into, or None
+        surface_y = None
+        for slope in self.at(rect.centerx):
+            if rect.colliderect(slope.rect):
+                slope_y = slope.get_y_at_x(rect.centerx)
+                if rect.bottom >= slope_y and (surface_y is None or slope_y < surface_y): surface_y = slope_y
+        return surface_y
+
+# --- Triggers ---
+# Spikes and checkpoints. evaluate() runs in each collision pass and reports which triggers the rect entered and exited since the last call.
+# Triggers are keyed by id() of their rect, so they can be added and removed as infinite mode streams chunks in and out.
+class TriggerSystem:
+    KIND_ORDER = {"spike": 0, "checkpoint": 1}
+    def __init__(self, triggers):
+        self.triggers = {id(rect): (kind, rect, obj) for kind, rect, obj in triggers}
+        self.index = IntervalIndex([(rect, key) for key, (kind, rect, obj) in self.triggers.items()])
+        self.inside = set()
+    def add(self, kind, rect, obj=None):
+        self.triggers[id(rect)] = (kind, rect, obj)
+        self.index.insert(rect, id(rect))
+    def remove(self, rect):
+        del self.triggers[id(rect)]
+        self.index.remove(rect)
+        self.inside.discard(id(rect))
+    def evaluate(self, rect):
+        current = {i for trigger_rect, i in self.index.query(rect.left, rect.right) if trigger_rect.colliderect(rect)}
+        entered = sorted((self.triggers[i] for i in current - self.inside), key=lambda t: self.KIND_ORDER[t[0]])
+        exited = [self.triggers[i] for i in self.inside - current]
+        self.inside = current
+        return entered, exited
+
+# --- Rewind ---
+# One entry per tick holding what that tick changed: (index, old value) for player fields and (pushable, old position) for moved pushables.
+# Undoing the newest entry steps back a tick, and since entries only depend on the head state the oldest can be dropped freely.
+# Every REWIND_KEYFRAME_INTERVAL ticks an entry also keeps a full keyframe, so a long jump back only walks the entries after the nearest one.
+class RewindBuffer:
+    def __init__(self, pushables=(), capacity=REWIND_SECONDS * FPS, keyframe_interval=REWIND_KEYFRAME_INTERVAL):
+        self.capacity = capacity
+        self.keyframe_interval = keyframe_interval
+        self.entries = deque()
+        self.fields = None # player fields at the head tick
+        self.positions = {obj: obj.rect.topleft for obj in pushables} # pushable positions at the head tick
+        self.tick = 0
+    def record(self, fields, moved):
+        if self.fields is None:
+            self.fields = fields
+            return
+        undo_fields = tuple((i, old) for i, (old, new) in enumerate(zip(self.fields, fields)) if old != new)
+        undo_pushables = []
+        for obj in moved:
+            pos, old = obj.rect.topleft, self.positions[obj]
+            if old != pos:
+                undo_pushables.append((obj, old))
+                self.positions[obj] = pos
+        self.tick += 1
+        keyframe = (fields, tuple(self.positions.items())) if self.tick % self.keyframe_interval == 0 else None
+        self.entries.append((undo_fields, tuple(undo_pushables), keyframe))
+        self.fields = fields
+        if len(self.entries) > self.capacity: self.entries.popleft()
+    def rewind(self, ticks):
+        # Returns (fields, {pushable: position}) for the state `ticks` ticks back, or None if there is no history left
+        ticks = min(ticks, len(self.entries))
+        if ticks == 0: return None
+        target = len(self.entries) - ticks
+        start, fields, changed = len(self.entries), list(self.fields), {}
+        if ticks > self.keyframe_interval:
+            # Keyframe i is the state after entry i, so start from the first one at or after the target instead of the head
+            for i in range(max(0, target - 1), target - 1 + self.keyframe_interval):
+                keyframe = self.entries[i][2]
+                if keyframe:
+                    start, fields, changed = i + 1, list(keyframe[0]), dict(keyframe[1])
+                    self.positions.update(changed)
+                    break
+        for i in range(start - 1, target - 1, -1):
+            undo_fields, undo_pushables, _ = self.entries[i]
+            for field, old in undo_fields: fields[field] = old
+            for obj, old in undo_pushables: changed[obj] = self.positions[obj] = old
+        for _ in range(ticks): self.entries.pop()
+        self.tick -= ticks
+        self.fields = tuple(fields)
+        return self.fields, changed
+    def __len__(self):
+        return len(self.entries)
+
+# --- Rendering ---
+# Layered renderer shared by the editor and play modes. Each layer is an IntervalIndex of (rect, (order, sprite)) that is only rebuilt
+# when marked dirty; drawing culls it to the view, restores insertion order and hands the visible sprites to a single Surface.blits call.
+# Sprites are rasterized once per kind/size/color and shared by every Renderer.
+class Renderer:
+    LAYERS = ("background", "static", "triggers", "pushables", "awake_pushables", "player", "hud")
+    SCREEN_SPACE = ("background", "hud")
+    sprites = {}
+    def __init__(self):
+        self.layers = {name: IntervalIndex() for name in self.LAYERS}
+        self.next_order = dict.fromkeys(self.LAYERS, 0)
+        self.dirty = set(self.LAYERS)
+        self.blit_calls = 0
+        self.blitted = 0
+    @classmethod
+    def sprite(cls, kind, size, color, *shape):
+        key = (kind, size, color) + shape
+        surf = cls.sprites.get(key)
+        if surf is None:
+            surf = cls.sprites[key] = cls.rasterize(kind, size, color, shape)
+        return surf
+    @staticmethod
+    def rasterize(kind, size, color, shape):
+        w, h = size
+        if kind == "rect":
+            # Opaque like pygame.draw.rect, which ignores the alpha of GOAL_COLOR and friends
+            surf = pygame.Surface(size)
+            surf.fill(color)
+            return surf.convert() if pygame.display.get_surface() else surf
+        if kind == "grid":
+            surf = pygame.Surface(size)
+            surf.fill(WHITE)
+            for x in range(0, w, GRID_SIZE): pygame.draw.line(surf, color, (x, 0), (x, h))
+            for y in range(0, h, GRID_SIZE): pygame.draw.line(surf, color, (0, y), (w, y))
+            return surf.convert() if pygame.display.get_surface() else surf
+        # Polygons include their right and bottom edge, so those sprites are a pixel larger than the rect
+        if kind in ("spike", "slope"):
+            # Opaque shapes use an RLE colorkey, which blits much faster than per-pixel alpha
+            surf = pygame.Surface((w + 1, h + 1))
+            surf.fill(SPRITE_COLORKEY)
+            if kind == "spike": pygame.draw.polygon(surf, color, [(0, h), (w // 2, 0), (w, h)])
+            else: pygame.draw.polygon(surf, color, [(0, shape[0]), (w, shape[1]), (w, h), (0, h)])
+            surf.set_colorkey(SPRITE_COLORKEY, pygame.RLEACCEL)
+            return surf.convert() if pygame.display.get_surface() else surf
+        surf = pygame.Surface((w + 1, h + 1), pygame.SRCALPHA)
+        if kind == "alpha": surf.fill(color, (0, 0, w, h))
+        elif kind == "ellipse": pygame.draw.ellipse(surf, color, (0, 0, w, h))
+        return surf.convert_alpha() if pygame.display.get_surface() else surf
+    def is_dirty(self, name):
+        return name in self.dirty
+    def mark_dirty(self, *names):
+        self.dirty.update(names)
+    def set_layer(self, name, items):
+        self.layers[name] = IntervalIndex([(rect, (order, surf)) for order, (rect, surf) in enumerate(items)])
+        self.next_order[name] = len(self.layers[name])
+        self.dirty.discard(name)
+    def add_item(self, name, rect, surf):
+        self.layers[name].insert(rect, (self.next_order[name], surf))
+        self.next_order[name] += 1
+    def remove_item(self, name, rect):
+        # A dirty layer is rebuilt from scratch on the next draw anyway
+        if name not in self.dirty: self.layers[name].remove(rect)
+    def draw(self, screen, camera):
+        offset = camera.camera.topleft
+        view = pygame.Rect(-offset[0], -offset[1], SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.blit_calls = self.blitted = 0
+        for name in self.LAYERS:
+            index = self.layers[name]
+            if not len(index): continue
+            screen_space = name in self.SCREEN_SPACE
+            if screen_space: visible = index.query(-sys.maxsize, sys.maxsize)
+            else: visible = [e for e in index.query(view.left, view.right) if e[0].bottom > view.top and e[0].top < view.bottom]
+            visible.sort(key=lambda e: e[1][0])
+            batch = [(surf, rect if screen_space else rect.move(offset)) for rect, (_, surf) in visible]
+            if batch:
+                screen.blits(batch, doreturn=False)
+                self.blit_calls += 1
+                self.blitted += len(batch)
 
 # --- Game State Classes (Menu, LevelSelect) ---
 class Menu:
+    is_animating = False # Static until there is input, so Game.run can block on events instead of redrawing
     def __init__(self, game):
         self.game = game
         self.font = pygame.font.Font(None, 50)
@@ -164,6 +449,7 @@ class LevelSelect(Menu):
         self.level_buttons = []
         self.levels_dir = "levels"
         self.scroll_y = 0
+        self.thumbnails = {}
         self.load_levels()
         self.back_button = Button(30, SCREEN_HEIGHT - 70, 150, 50, "Back", GREY, HOVER_GREY)
         self.search_box = TextInputBox(SCREEN_WIDTH // 2 - 150, 10, 300, 40, self.font)
@@ -213,6 +499,17 @@ class LevelSelect(Menu):
                     with open(level_path, 'r') as f: level_data = f.readlines()
                     self.game.start_editing(level_data=level_data, filename=btn_group['filename'])
 
+    def get_thumbnail(self, filename):
+        # Loaded on first draw, so only rows that have been scrolled into view are ever read from the cache
+        if filename not in self.thumbnails:
+            try:
+                self.thumbnails[filename] = level_thumbnails.load_thumbnail(os.path.join(self.levels_dir, filename))
+            except (OSError, ValueError, pygame.error) as e:
+                print(f"Could not load thumbnail for {filename}: {e}")
+                self.thumbnails[filename] = pygame.Surface(level_thumbnails.THUMB_SIZE)
+                self.thumbnails[filename].fill(UI_PANEL_COLOR)
+        return self.thumbnails[filename]
+
     def update(self):
         mouse_pos = pygame.mouse.get_pos()
         self.back_button.check_hover(mouse_pos)
@@ -227,13 +524,95 @@ class LevelSelect(Menu):
         title_font = pygame.font.Font(None, 74)
         title_surf = title_font.render("Select a Level", True, BLACK)
         screen.blit(title_surf, title_surf.get_rect(center=(SCREEN_WIDTH // 2, 50)))
-        self.back_button.draw(screen, self.font)
         for btn_group in self.level_buttons:
+            row_rect = btn_group['play'].rect.move(0, -self.scroll_y)
+            if row_rect.bottom < 0 or row_rect.top > SCREEN_HEIGHT: continue
+            thumb_pos = (row_rect.x - level_thumbnails.THUMB_SIZE[0] - 10, row_rect.y)
+            screen.blit(self.get_thumbnail(btn_group['filename']), thumb_pos)
+            pygame.draw.rect(screen, LIGHT_GREY, (thumb_pos, level_thumbnails.THUMB_SIZE), 1)
             btn_group['play'].draw(screen, self.font, -self.scroll_y)
             btn_group['edit'].draw(screen, self.font, -self.scroll_y)
+        self.back_button.draw(screen, self.font)
+
+# --- Level Saving ---
+class LevelSaver:
+    # Saves run on a worker thread from a snapshot of the object list; queued saves of the same file collapse into the latest one
+    def __init__(self):
+        self.pending = {} # level path -> (objects snapshot, callback run on the worker once the file is written)
+        self.busy = False
+        self.condition = threading.Condition()
+        self.thumbnail_jobs = {} # level path -> process rendering its preview; in-process it would hold the GIL and stall the editor's frames
+        threading.Thread(target=self.run, daemon=True).start()
+    def save(self, level_path, objects, on_saved=None):
+        with self.condition:
+            self.pending[level_path] = (objects, on_saved)
+            self.condition.notify_all()
+    def flush(self):
+        with self.condition:
+            while self.pending or self.busy: self.condition.wait()
+    def close(self):
+        self.flush()
+        for job in self.thumbnail_jobs.values(): job.wait()
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending: self.condition.wait()
+                level_path, (objects, on_saved) = self.pending.popitem()
+                self.busy = True
+            # Nothing may escape this loop: a dead worker would silently drop every later save and hang flush()
+            try:
+                self.write(level_path, self.serialize(objects))
+                print(f"Level saved to {os.path.basename(level_path)}")
+                if on_saved: on_saved()
+            except Exception as e:
+                print(f"ERROR: Could not save {level_path}: {e}")
+            else:
+                # The preview is optional; failing to render it must not fail the save
+                try:
+                    # A render still running for this level is left to finish; the level list renders whatever preview is missing
+                    job = self.thumbnail_jobs.get(level_path)
+                    if job is None or job.poll() is not None:
+                        self.thumbnail_jobs[level_path] = self.start_thumbnail(level_path)
+                except Exception as e:
+                    print(f"Could not update thumbnail for {os.path.basename(level_path)}: {e}")
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+    @staticmethod
+    def start_thumbnail(level_path):
+        # Lowest priority from the start, pygame import included, so it only gets CPU time the editor leaves unused
+        command = [sys.executable, level_thumbnails.__file__, level_path]
+        env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+        if os.name == "nt": return subprocess.Popen(command, env=env, creationflags=subprocess.IDLE_PRIORITY_CLASS)
+        return subprocess.Popen(["nice", "-n", "19"] + command, env=env)
+    @staticmethod
+    def serialize(objects):
+        lines = []
+        for i, obj in enumerate(objects):
+            r = obj.rect
+            if isinstance(obj, Slope): lines.append(f"{obj.type},{r.x},{r.y},{r.width},{r.height},{obj.left_top},{obj.right_top}\n")
+            else: lines.append(f"{obj.type},{r.x},{r.y},{r.width},{r.height}\n")
+            # Hand the GIL back every batch, or the editor waits out a whole switch interval each time it needs it during a big save
+            if i % SAVE_BATCH_SIZE == SAVE_BATCH_SIZE - 1: time.sleep(0)
+        return "".join(lines)
+    @staticmethod
+    def write(level_path, text):
+        # Written in full to a temp file next to the level and swapped in, so a crash mid-save leaves the old level intact
+        tmp_path = f"{level_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, level_path)
+        except OSError:
+            if os.path.isfile(tmp_path): os.remove(tmp_path)
+            raise
 
 # --- Level Editor ---
 class LevelEditor(LevelSelect):
+    is_animating = True
     def __init__(self, game, level_data=None, filename=None):
         super().__init__(game)
         self.current_level_filename = os.path.splitext(filename)[0] if filename else None
@@ -247,6 +626,7 @@ class LevelEditor(LevelSelect):
         self.ui_width = 220
         self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.camera.camera.x = 0
+        self.renderer = Renderer()
         self.font = pygame.font.Font(None, 40)
         self.button_font = pygame.font.Font(None, 28)
         self.title_font = pygame.font.Font(None, 36)
@@ -274,6 +654,10 @@ class LevelEditor(LevelSelect):
             self.save_as_button = Button(115, SCREEN_HEIGHT - 105, 95, 40, "Save As", (200, 255, 200), (150, 255, 150))
         self.back_button = Button(10, SCREEN_HEIGHT - 60, 200, 40, "Back to Menu", (220, 220, 220), HOVER_GREY)
         self.text_input_box = None
+        self.revision = 0
+        self.saved_revision = 0
+        self.invalid_revision = None # last revision autosave found without a start or goal, so the error is printed once
+        self.last_autosave = pygame.time.get_ticks()
     def load_level_for_edit(self, level_data):
         for item in level_data:
             parts = item.strip().split(',')
@@ -314,6 +698,7 @@ class LevelEditor(LevelSelect):
             if self.back_button.is_clicked(event): self.game.change_state(MENU)
             if self.snap_button.is_clicked(event):
                 self.snap_to_grid = not self.snap_to_grid
+                self.renderer.mark_dirty("background")
                 self.snap_button.text = f"Snap: {'ON' if self.snap_to_grid else 'OFF'}"
             if event.type == pygame.MOUSEBUTTONDOWN:
                 for i, btn in enumerate(self.palette_buttons):
@@ -341,8 +726,8 @@ class LevelEditor(LevelSelect):
         if self.snap_to_grid:
             x = (x // GRID_SIZE) * GRID_SIZE
             y = (y // GRID_SIZE) * GRID_SIZE
-        if self.selected_object_type == "start": self.objects = [o for o in self.objects if o.type != "start"]; self.objects.append(GameObject(x, y, 40, 50, GREEN, "start"))
-        elif self.selected_object_type == "goal": self.objects = [o for o in self.objects if o.type != "goal"]; self.objects.append(GameObject(x, y, 80, 80, GOAL_COLOR, "goal"))
+        if self.selected_object_type == "start": self.remove_objects(lambda o: o.type == "start"); self.objects.append(GameObject(x, y, 40, 50, GREEN, "start"))
+        elif self.selected_object_type == "goal": self.remove_objects(lambda o: o.type == "goal"); self.objects.append(GameObject(x, y, 80, 80, GOAL_COLOR, "goal"))
         elif self.selected_object_type == "platform": self.objects.append(GameObject(x, y, 100, 20, RED, "platform"))
         elif self.selected_object_type == "pushable": self.objects.append(PushableObject(x, y, 40, 40, PURPLE))
         elif self.selected_object_type == "trampoline": self.objects.append(GameObject(x, y, 80, 20, TRAMPOLINE_COLOR, "trampoline"))
@@ -352,13 +737,26 @@ class LevelEditor(LevelSelect):
         elif self.selected_object_type == "slope_down": self.objects.append(Slope(x, y, 100, 100, SLOPE_COLOR, 0, 100))
         elif self.selected_object_type == "spike": self.objects.append(GameObject(x, y, 20, 20, SPIKE_COLOR, "spike"))
         elif self.selected_object_type == "checkpoint": self.objects.append(GameObject(x, y, 20, 60, CHECKPOINT_COLOR, "checkpoint"))
+        else: return
+        self.renderer.add_item("static", *self.render_item(self.objects[-1]))
+        self.revision += 1
     def delete_object(self, pos):
-        self.objects = [o for o in self.objects if not o.rect.collidepoint(pos)]
+        if self.remove_objects(lambda o: o.rect.collidepoint(pos)): self.revision += 1
+    def remove_objects(self, predicate):
+        # Removed objects are taken out of the static layer one by one rather than rebuilding it
+        kept, removed = [], []
+        for obj in self.objects: (removed if predicate(obj) else kept).append(obj)
+        if removed:
+            self.objects = kept
+            for obj in removed: self.renderer.remove_item("static", obj.rect)
+        return removed
     def update(self):
         keys = pygame.key.get_pressed()
+        camera_x = self.camera.camera.x
         if keys[pygame.K_LEFT] or keys[pygame.K_a]: self.camera.camera.x += 10
         if keys[pygame.K_RIGHT] or keys[pygame.K_d]: self.camera.camera.x -= 10
         self.camera.camera.x = min(0, self.camera.camera.x)
+        if self.camera.camera.x != camera_x: self.renderer.mark_dirty("background")
         mouse_pos = pygame.mouse.get_pos()
         for button in self.palette_buttons: button.check_hover(mouse_pos, -self.palette_scroll_y)
         self.save_button.check_hover(mouse_pos)
@@ -366,16 +764,17 @@ class LevelEditor(LevelSelect):
             self.save_as_button.check_hover(mouse_pos)
         self.back_button.check_hover(mouse_pos)
         self.snap_button.check_hover(mouse_pos)
+        self.autosave()
+    def autosave(self):
+        now = pygame.time.get_ticks()
+        if now - self.last_autosave < AUTOSAVE_INTERVAL_MS: return
+        self.last_autosave = now
+        if self.current_level_filename and self.revision not in (self.saved_revision, self.invalid_revision):
+            if not self.save_level(self.current_level_filename): self.invalid_revision = self.revision
     def draw(self, screen):
         screen.fill(WHITE)
-        self.draw_grid(screen)
-        for obj in self.objects:
-            if obj.type == "spike":
-                pts = [(obj.rect.left, obj.rect.bottom), (obj.rect.centerx, obj.rect.top), (obj.rect.right, obj.rect.bottom)]
-                cam_pts = [(p[0] + self.camera.camera.x, p[1] + self.camera.camera.y) for p in pts]
-                pygame.draw.polygon(screen, obj.color, cam_pts)
-            elif isinstance(obj, Slope): obj.draw(screen, self.camera)
-            else: pygame.draw.rect(screen, obj.color, self.camera.apply(obj))
+        self.build_render_layers()
+        self.renderer.draw(screen, self.camera)
         self.draw_ghost(screen)
         ui_panel = pygame.Rect(0, 0, self.ui_width, SCREEN_HEIGHT)
         pygame.draw.rect(screen, UI_PANEL_COLOR, ui_panel)
@@ -390,11 +789,17 @@ class LevelEditor(LevelSelect):
         self.back_button.draw(screen, self.button_font)
         if self.text_input_box:
             self.text_input_box.draw(screen)
-    def draw_grid(self, screen):
-        if self.snap_to_grid:
-            offset_x = self.camera.camera.x % GRID_SIZE
-            for x in range(0, SCREEN_WIDTH + GRID_SIZE, GRID_SIZE): pygame.draw.line(screen, LIGHT_GREY, (x + offset_x, 0), (x + offset_x, SCREEN_HEIGHT))
-            for y in range(0, SCREEN_HEIGHT, GRID_SIZE): pygame.draw.line(screen, LIGHT_GREY, (0, y), (SCREEN_WIDTH, y))
+    def render_item(self, obj):
+        if obj.type == "spike": return obj.rect, Renderer.sprite("spike", obj.rect.size, obj.color)
+        if isinstance(obj, Slope): return obj.rect, Renderer.sprite("slope", obj.rect.size, obj.color, obj.left_top, obj.right_top)
+        return obj.rect, Renderer.sprite("rect", obj.rect.size, obj.color)
+    def build_render_layers(self):
+        r = self.renderer
+        if r.is_dirty("background"):
+            grid = r.sprite("grid", (SCREEN_WIDTH + GRID_SIZE, SCREEN_HEIGHT), LIGHT_GREY)
+            r.set_layer("background", [(grid.get_rect(topleft=(self.camera.camera.x % GRID_SIZE, 0)), grid)] if self.snap_to_grid else [])
+        if r.is_dirty("static"):
+            r.set_layer("static", [self.render_item(obj) for obj in self.objects])
     def draw_ghost(self, screen):
         if self.selected_object_type is None: return
         mouse_pos = pygame.mouse.get_pos()
@@ -426,23 +831,24 @@ class LevelEditor(LevelSelect):
     def save_level(self, filename):
         if not filename:
             print("Save cancelled.")
-            return
+            return False
         has_start = any(o.type == "start" for o in self.objects)
         has_goal = any(o.type == "goal" for o in self.objects)
         if not has_start or not has_goal:
             print("ERROR: Level must have a Start Point and an End Goal to be saved.")
-            return
+            return False
         if not os.path.exists("levels"): os.makedirs("levels")
-        with open(os.path.join("levels", f"{filename}.txt"), "w") as f:
-            for obj in self.objects:
-                if isinstance(obj, Slope):
-                    f.write(f"{obj.type},{obj.rect.x},{obj.rect.y},{obj.rect.width},{obj.rect.height},{obj.left_top},{obj.right_top}\n")
-                else:
-                    f.write(f"{obj.type},{obj.rect.x},{obj.rect.y},{obj.rect.width},{obj.rect.height}\n")
-        print(f"Level saved to {filename}.txt")
+        # Placed objects are never modified in the editor, so a shallow copy of the list is a consistent snapshot.
+        # The revision only counts as saved once the worker has actually written it.
+        revision = self.revision
+        self.game.level_saver.save(os.path.join("levels", f"{filename}.txt"), list(self.objects), lambda: self.mark_saved(revision))
+        return True
+    def mark_saved(self, revision):
+        self.saved_revision = revision
 
 # --- Playing State ---
 class Playing:
+    is_animating = True
     def __init__(self, game, level_data=None):
         self.game = game
         self.is_3d_mode = False
@@ -460,6 +866,9 @@ class Playing:
         self.last_checkpoint = self.start_pos
         self.goal_rect = None
         self.level_data = level_data
+        self.renderer = Renderer()
+        self.hud_font = pygame.font.Font(None, 36)
+        self.hud_text = None
         self.load_level(self.level_data)
         self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
     def load_level(self, level_data):
@@ -482,6 +891,87 @@ class Playing:
                 elif obj_type == "slope": self.slopes.append(Slope(data[0], data[1], data[2], data[3], SLOPE_COLOR, data[4], data[5]))
                 elif obj_type == "spike": self.spikes.append(pygame.Rect(*data))
                 elif obj_type == "checkpoint": self.checkpoints.append(GameObject(data[0], data[1], data[2], data[3], CHECKPOINT_COLOR, "checkpoint"))
+        self.pushable_starts = [(obj, obj.rect.topleft) for obj in self.pushable_objects]
+        self.active_checkpoints = ()
+        self.build_indexes()
+        self.rewind = RewindBuffer(self.pushable_objects)
+    def build_indexes(self):
+        self.renderer.mark_dirty("static", "triggers", "pushables")
+        self.slope_rects = [s.rect for s in self.slopes]
+        self.slope_index = SlopeIndex(self.slopes)
+        self.build_broadphase()
+        self.build_triggers()
+    # Incremental counterparts of build_indexes for (type, object) pairs added to or removed from the level lists,
+    # in the order build_render_layers would lay them out
+    def index_objects(self, objects):
+        r = self.renderer
+        for obj_type, obj in objects:
+            if obj_type == "spike":
+                self.triggers.add("spike", obj)
+                r.add_item("triggers", obj, r.sprite("spike", obj.size, SPIKE_COLOR))
+            elif obj_type == "slope":
+                self.slope_rects.append(obj.rect)
+                self.slope_index.insert(obj)
+                self.static_grid.insert(id(obj.rect), obj.rect)
+                r.add_item("static", obj.rect, r.sprite("slope", obj.rect.size, obj.color, obj.left_top, obj.right_top))
+            elif obj_type == "trampoline":
+                r.add_item("static", obj, r.sprite("rect", obj.size, TRAMPOLINE_COLOR))
+            else:
+                self.static_grid.insert(id(obj), obj)
+                r.add_item("static", obj, r.sprite("rect", obj.size, GREY if obj_type == "platform" else WALL_3D_COLOR))
+                # 3D walls also get a drop shadow in 3D mode, which only a full layer rebuild lays out
+                if obj_type == "wall_3d" and self.is_3d_mode: r.mark_dirty("static")
+    def unindex_objects(self, objects):
+        r = self.renderer
+        for obj_type, obj in objects:
+            if obj_type == "spike":
+                self.triggers.remove(obj)
+                r.remove_item("triggers", obj)
+            elif obj_type == "slope":
+                self.slope_index.remove(obj)
+                self.static_grid.remove(id(obj.rect))
+                r.remove_item("static", obj.rect)
+            else:
+                if obj_type != "trampoline": self.static_grid.remove(id(obj))
+                r.remove_item("static", obj)
+                if obj_type == "wall_3d" and self.is_3d_mode: r.mark_dirty("static")
+        self.slope_rects = [s.rect for s in self.slopes]
+    def build_triggers(self):
+        triggers = [("spike", spike, None) for spike in self.spikes] + [("checkpoint", cp.rect, cp) for cp in self.checkpoints]
+        self.triggers = TriggerSystem(triggers)
+    def evaluate_triggers(self, rect):
+        # Returns True when a spike reset the level, which ends the current collision pass
+        entered, _ = self.triggers.evaluate(rect)
+        for kind, trigger_rect, obj in entered:
+            if kind == "spike":
+                self.reset_level()
+                return True
+            if kind == "checkpoint" and self.last_checkpoint != trigger_rect.topleft:
+                self.last_checkpoint = trigger_rect.topleft
+                self.active_checkpoints += (obj,)
+                obj.color = CHECKPOINT_ACTIVE_COLOR
+                self.renderer.mark_dirty("triggers")
+        return False
+    def build_broadphase(self):
+        self.static_grid = SpatialGrid()
+        for rect in self.platforms + self.walls_3d + self.v_walls + self.slope_rects:
+            self.static_grid.insert(id(rect), rect)
+        self.pushable_grid = SpatialGrid()
+        for obj in self.pushable_objects: self.pushable_grid.insert(obj, obj.rect)
+        self.awake_pushables = [obj for obj in self.pushable_objects if not obj.is_sleeping]
+    # Sleeping pushables sit in a cached render layer; only awake ones are re-laid out each frame, and the cache is rebuilt when one wakes or sleeps
+    def wake_pushable(self, obj):
+        if obj.is_sleeping:
+            self.awake_pushables.append(obj)
+            self.renderer.mark_dirty("pushables")
+        obj.wake()
+    def update_sleeping(self):
+        for obj in self.awake_pushables:
+            obj.sleep_timer -= 1
+            if obj.sleep_timer <= 0: obj.is_sleeping = True
+        if any(obj.is_sleeping for obj in self.awake_pushables):
+            self.awake_pushables = [obj for obj in self.awake_pushables if not obj.is_sleeping]
+            self.renderer.mark_dirty("pushables")
     def handle_events(self, events):
         for event in events:
             if event.type == pygame.KEYDOWN:
@@ -506,10 +996,14 @@ class Playing:
         self.player.size = (40, 40) if self.is_3d_mode else (40, 50)
         self.player.center = center
         for obj in self.pushable_objects: obj.is_static = not self.is_3d_mode
+        self.renderer.mark_dirty("static")
         if not self.is_3d_mode: self.player_vel_y = 0
         self.is_grabbing = False
     def update(self):
         keys = pygame.key.get_pressed()
+        if keys[pygame.K_r]:
+            self.rewind_step()
+            return
         self.is_grabbing = keys[pygame.K_k] and self.is_3d_mode
         dx = ((keys[pygame.K_RIGHT] or keys[pygame.K_d]) - (keys[pygame.K_LEFT] or keys[pygame.K_a])) * 5
         dy = 0
@@ -530,6 +1024,7 @@ class Playing:
         self.handle_collisions('horizontal', dx)
         self.player.y += dy
         self.handle_collisions('vertical', dy)
+        if self.awake_pushables: self.update_sleeping()
         if self.on_ground: self.coyote_timer = COYOTE_TIME_FRAMES
         else: self.coyote_timer -= 1
         self.camera.update(self.player)
@@ -537,33 +1032,69 @@ class Playing:
         if self.goal_rect and self.player.colliderect(self.goal_rect):
             print("Level Complete!")
             self.game.change_state(MENU)
+        self.rewind.record(self.rewind_fields(), self.awake_pushables)
+        if self.game.spectators: self.game.spectators.publish(self.spectator_state())
+    def rewind_fields(self):
+        return (self.player.x, self.player.y, self.player.width, self.player.height, self.player_vel_y, self.player_z, self.player_vel_z,
+                self.is_3d_mode, self.on_ground, self.coyote_timer, self.is_wall_sliding, self.wall_slide_dir, self.last_checkpoint, self.active_checkpoints)
+    def rewind_step(self, ticks=REWIND_SCRUB_TICKS):
+        restored = self.rewind.rewind(ticks)
+        if restored is None: return
+        fields, positions = restored
+        (self.player.x, self.player.y, self.player.width, self.player.height, self.player_vel_y, self.player_z, self.player_vel_z,
+         is_3d_mode, self.on_ground, self.coyote_timer, self.is_wall_sliding, self.wall_slide_dir, self.last_checkpoint, active_checkpoints) = fields
+        if active_checkpoints != self.active_checkpoints:
+            self.set_active_checkpoints(active_checkpoints)
+        if is_3d_mode != self.is_3d_mode:
+            self.is_3d_mode = is_3d_mode
+            for obj in self.pushable_objects: obj.is_static = not self.is_3d_mode
+            self.renderer.mark_dirty("static")
+        self.is_grabbing = False
+        for obj, pos in positions.items():
+            obj.rect.topleft = pos
+            self.pushable_grid.move(obj, obj.rect)
+        if positions: self.renderer.mark_dirty("pushables")
+        # Re-seed what the player is inside, so triggers it already overlapped at the restored tick don't fire again
+        self.triggers.evaluate(self.player)
+        self.camera.update(self.player)
+        if self.game.spectators: self.game.spectators.publish(self.spectator_state())
+    def set_active_checkpoints(self, active_checkpoints):
+        for cp in self.active_checkpoints: cp.color = CHECKPOINT_COLOR
+        for cp in active_checkpoints: cp.color = CHECKPOINT_ACTIVE_COLOR
+        self.active_checkpoints = active_checkpoints
+        self.renderer.mark_dirty("triggers")
+    def spectator_state(self):
+        return {
+            "p": list(self.player), "m": int(self.is_3d_mode), "z": self.player_z,
+            "vy": self.player_vel_y, "vz": self.player_vel_z,
+            "b": [list(obj.rect.topleft) for obj in self.pushable_objects]
+        }
     def reset_level(self):
-        self.player.topleft = self.last_checkpoint
+        # Restarts the level in place instead of re-parsing it, so the rewind history keeps the same pushables and a death can be rewound
+        self.player.topleft = self.start_pos
         self.player_vel_y = 0
-        self.load_level(self.level_data)
+        self.last_checkpoint = self.start_pos
+        self.set_active_checkpoints(())
+        for obj, pos in self.pushable_starts:
+            if obj.rect.topleft != pos:
+                obj.rect.topleft = pos
+                self.pushable_grid.move(obj, obj.rect)
+                self.wake_pushable(obj)
+        self.triggers.inside = set()
     def handle_collisions(self, axis, movement):
         self.on_ground = False
         self.is_wall_sliding = False
         if not self.is_3d_mode and axis == 'vertical':
-            for slope in self.slopes:
-                if self.player.colliderect(slope.rect):
-                    if 0 <= self.player.centerx - slope.rect.x <= slope.rect.width:
-                        slope_y = slope.get_y_at_x(self.player.centerx)
-                        if self.player.bottom >= slope_y:
-                            self.player.bottom = slope_y; self.on_ground = True; self.player_vel_y = 0
-        for spike in self.spikes:
-            if self.player.colliderect(spike):
-                self.reset_level()
-                return
-        for cp in self.checkpoints:
-            if self.player.colliderect(cp.rect):
-                if self.last_checkpoint != cp.rect.topleft:
-                    self.last_checkpoint = cp.rect.topleft
-                    cp.color = CHECKPOINT_ACTIVE_COLOR
-        static_colliders = self.platforms + [obj.rect for obj in self.pushable_objects if obj.is_static]
+            slope_y = self.slope_index.surface_at(self.player)
+            if slope_y is not None:
+                self.player.bottom = slope_y; self.on_ground = True; self.player_vel_y = 0
+        # Triggers see the player before this pass resolves collisions, so spikes set into the ground still register.
+        # A spike reset ends the pass, and the rest of the tick carries on from the respawn point.
+        if self.evaluate_triggers(self.player): return
+        static_colliders = self.platforms + [obj.rect for obj in self.pushable_grid.query(self.player) if obj.is_static]
         if self.is_3d_mode:
             if self.player_z == 0:
-                static_colliders += self.walls_3d + self.v_walls + [s.rect for s in self.slopes]
+                static_colliders += self.walls_3d + self.v_walls + self.slope_rects
         else:
             static_colliders += self.walls_3d + self.v_walls
         for plat in static_colliders:
@@ -587,8 +1118,7 @@ class Playing:
                 if self.player.colliderect(tramp) and self.player_vel_y > 0:
                     self.player.bottom = tramp.top; self.player_vel_y = TRAMPOLINE_BOUNCE
         if self.is_3d_mode:
-            colliders_3d = [s.rect for s in self.slopes]
-            if self.player_z == 0: colliders_3d.extend(self.walls_3d)
+            colliders_3d = self.slope_rects + self.walls_3d if self.player_z == 0 else self.slope_rects
             for wall in colliders_3d:
                 if self.player.colliderect(wall):
                     if axis == 'horizontal':
@@ -597,8 +1127,7 @@ class Playing:
                     elif axis == 'vertical':
                         if movement > 0: self.player.bottom = wall.top
                         if movement < 0: self.player.top = wall.bottom
-            all_static = self.platforms + self.walls_3d + self.v_walls + [s.rect for s in self.slopes]
-            for obj in self.pushable_objects:
+            for obj in self.pushable_grid.query(self.player):
                 if self.player.colliderect(obj.rect):
                     if self.is_grabbing:
                         damp_factor = 0.9
@@ -608,13 +1137,12 @@ class Playing:
                             move_x = 0
                             move_y = movement * damp_factor
                         temp_rect = obj.rect.move(move_x, move_y)
-                        can_move = True
-                        for s in all_static:
-                            if temp_rect.colliderect(s):
-                                can_move = False
-                                break
-                        if can_move:
-                            obj.rect = temp_rect
+                        if temp_rect == obj.rect or self.static_grid.collides(temp_rect): continue
+                        # Only pushables it wasn't already overlapping block it, so overlapping crates from the editor can separate
+                        if any(other is not obj and not other.rect.colliderect(obj.rect) for other in self.pushable_grid.query(temp_rect)): continue
+                        obj.rect = temp_rect
+                        self.pushable_grid.move(obj, temp_rect)
+                        self.wake_pushable(obj)
                     else:
                         if axis == 'horizontal':
                             if movement > 0: self.player.right = obj.rect.left
@@ -624,67 +1152,59 @@ class Playing:
                             if movement < 0: self.player.top = obj.rect.bottom
     def draw(self, screen):
         screen.fill(WHITE)
-        visible_world_rect = pygame.Rect(-self.camera.camera.x, -self.camera.camera.y, SCREEN_WIDTH, SCREEN_HEIGHT)
-        for plat in self.platforms:
-            if plat.colliderect(visible_world_rect):
-                pygame.draw.rect(screen, GREY, self.camera.apply_rect(plat))
-        if self.goal_rect and self.goal_rect.colliderect(visible_world_rect):
-            goal_surf = pygame.Surface(self.goal_rect.size, pygame.SRCALPHA)
-            goal_surf.fill(GOAL_COLOR)
-            screen.blit(goal_surf, self.camera.apply_rect(self.goal_rect))
-        for cp in self.checkpoints:
-            if cp.rect.colliderect(visible_world_rect):
-                cp_surf = pygame.Surface(cp.rect.size, pygame.SRCALPHA)
-                cp_surf.fill(cp.color)
-                screen.blit(cp_surf, self.camera.apply_rect(cp.rect))
-        for spike in self.spikes:
-            if spike.colliderect(visible_world_rect):
-                pts = [(spike.left, spike.bottom), (spike.centerx, spike.top), (spike.right, spike.bottom)]
-                cam_pts = [self.camera.apply_rect(pygame.Rect(p, (1,1))).topleft for p in pts]
-                pygame.draw.polygon(screen, SPIKE_COLOR, cam_pts)
-        for tramp in self.trampolines:
-            if tramp.colliderect(visible_world_rect):
-                pygame.draw.rect(screen, TRAMPOLINE_COLOR, self.camera.apply_rect(tramp))
-        for wall in self.walls_3d:
-            if wall.colliderect(visible_world_rect):
+        self.build_render_layers()
+        self.renderer.draw(screen, self.camera)
+    def build_render_layers(self):
+        r = self.renderer
+        if r.is_dirty("static"):
+            items = [(plat, r.sprite("rect", plat.size, GREY)) for plat in self.platforms]
+            items += [(tramp, r.sprite("rect", tramp.size, TRAMPOLINE_COLOR)) for tramp in self.trampolines]
+            for wall in self.walls_3d:
                 if self.is_3d_mode:
-                    shadow_surf = pygame.Surface((wall.width, 10), pygame.SRCALPHA)
-                    shadow_surf.fill(WALL_3D_SHADOW_COLOR)
-                    screen.blit(shadow_surf, self.camera.apply_rect(wall).move(5, wall.height - 5))
-                pygame.draw.rect(screen, WALL_3D_COLOR, self.camera.apply_rect(wall))
-        for wall in self.v_walls:
-            if wall.colliderect(visible_world_rect):
-                pygame.draw.rect(screen, WALL_3D_COLOR, self.camera.apply_rect(wall))
-        for slope in self.slopes:
-            if slope.rect.colliderect(visible_world_rect):
-                slope.draw(screen, self.camera)
-        for obj in self.pushable_objects:
-            if obj.rect.colliderect(visible_world_rect):
-                obj.draw(screen, self.camera)
+                    items.append((pygame.Rect(wall.x + 5, wall.bottom - 5, wall.width, 10), r.sprite("alpha", (wall.width, 10), WALL_3D_SHADOW_COLOR)))
+                items.append((wall, r.sprite("rect", wall.size, WALL_3D_COLOR)))
+            items += [(wall, r.sprite("rect", wall.size, WALL_3D_COLOR)) for wall in self.v_walls]
+            items += [(slope.rect, r.sprite("slope", slope.rect.size, slope.color, slope.left_top, slope.right_top)) for slope in self.slopes]
+            r.set_layer("static", items)
+        if r.is_dirty("triggers"):
+            items = [(self.goal_rect, r.sprite("alpha", self.goal_rect.size, GOAL_COLOR))] if self.goal_rect else []
+            items += [(cp.rect, r.sprite("alpha", cp.rect.size, cp.color)) for cp in self.checkpoints]
+            items += [(spike, r.sprite("spike", spike.size, SPIKE_COLOR)) for spike in self.spikes]
+            r.set_layer("triggers", items)
+        if r.is_dirty("pushables"):
+            r.set_layer("pushables", [(obj.rect.copy(), r.sprite("rect", obj.rect.size, obj.color)) for obj in self.pushable_objects if obj.is_sleeping])
+        r.set_layer("awake_pushables", [(obj.rect.copy(), r.sprite("rect", obj.rect.size, obj.color)) for obj in self.awake_pushables])
         player_color = GREEN if self.is_3d_mode else BLUE
         if self.is_wall_sliding: player_color = (0, 200, 200)
-        player_draw_rect = self.camera.apply(self.player)
+        player_draw_rect = self.player.copy()
+        items = []
         if self.is_3d_mode:
             if self.player_z < 0:
                 shadow_size = self.player.width
                 shadow_rect = pygame.Rect(0, 0, shadow_size, shadow_size // 2)
-                shadow_rect.center = player_draw_rect.center
-                shadow_surf = pygame.Surface(shadow_rect.size, pygame.SRCALPHA)
-                pygame.draw.ellipse(shadow_surf, (0,0,0,100), (0,0,shadow_size, shadow_size//2))
-                screen.blit(shadow_surf, shadow_rect)
+                shadow_rect.center = self.player.center
+                items.append((shadow_rect, r.sprite("ellipse", shadow_rect.size, (0,0,0,100))))
             scale = 1 + (abs(self.player_z) / (Z_JUMP_HEIGHT * 4))
             player_draw_rect.width = int(self.player.width * scale)
             player_draw_rect.height = int(self.player.height * scale)
-            original_center = self.camera.apply(self.player).center
-            player_draw_rect.centerx = original_center[0]
-            player_draw_rect.centery = original_center[1] + int(self.player_z)
-        pygame.draw.rect(screen, player_color, player_draw_rect)
-        font = pygame.font.Font(None, 36)
+            player_draw_rect.centerx = self.player.centerx
+            player_draw_rect.centery = self.player.centery + int(self.player_z)
+        items.append((player_draw_rect, r.sprite("rect", player_draw_rect.size, player_color)))
+        r.set_layer("player", items)
         mode_text = f"Mode: {'3D (Grab)' if self.is_grabbing else '3D' if self.is_3d_mode else '2D'}"
-        screen.blit(font.render(mode_text, True, BLACK), (10, 10))
+        if mode_text != self.hud_text:
+            self.hud_text = mode_text
+            text_surf = self.hud_font.render(mode_text, True, BLACK)
+            r.set_layer("hud", [(text_surf.get_rect(topleft=(10, 10)), text_surf)])
 
 class PlayingInfinite(Playing):
-    def __init__(self, game):
+    RENDER_ORDER = {"platform": 0, "trampoline": 1, "wall_3d": 2, "slope": 3, "spike": 4}
+    def __init__(self, game, seed=None):
+        # Runs are stitched from the pre-generated chunk library, so the same seed always plays the same course
+        self.library = chunk_library.load_library()
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.chunks = self.library.stitch(self.seed)
+        print(f"Infinite run seed: {self.seed}")
         super().__init__(game, level_data=[])
         self.last_generated_x = 0
         self.generate_chunk(0)
@@ -694,79 +1214,75 @@ class PlayingInfinite(Playing):
         self.player_z = 0
         self.player_vel_z = 0
         self.last_generated_x = 0
+        self.chunks = self.library.stitch(self.seed)
         self.platforms, self.pushable_objects, self.trampolines, self.walls_3d, self.slopes, self.spikes, self.checkpoints, self.v_walls = [], [], [], [], [], [], [], []
         self.platforms.append(pygame.Rect(0, SCREEN_HEIGHT - 20, SCREEN_WIDTH * 2, 20))
+        self.build_indexes()
         self.generate_chunk(0)
+        self.rewind = RewindBuffer(self.pushable_objects)
     def generate_chunk(self, start_x):
-        chunk_width = SCREEN_WIDTH 
-        end_x = start_x + chunk_width
-        patterns = ['flat_gap', 'platforms', 'spike_pit', 'slope_jump', 'wall_climb']
-        chosen_pattern = random.choice(patterns)
-        if chosen_pattern == 'flat_gap':
-            gap_start = start_x + random.randint(100, 300)
-            gap_end = gap_start + random.randint(100, 250)
-            self.platforms.append(pygame.Rect(start_x - 20, SCREEN_HEIGHT - 40, gap_start - start_x + 20, 40))
-            self.platforms.append(pygame.Rect(gap_end, SCREEN_HEIGHT - 40, end_x - gap_end + 20, 40))
-        elif chosen_pattern == 'platforms':
-            for i in range(random.randint(3, 6)):
-                px = start_x + random.randint(0, chunk_width - 100)
-                py = random.randint(SCREEN_HEIGHT - 250, SCREEN_HEIGHT - 80)
-                self.platforms.append(pygame.Rect(px, py, random.randint(80, 150), 20))
-        elif chosen_pattern == 'spike_pit':
-            pit_start = start_x + random.randint(100, 200)
-            pit_width = random.randint(80, 200)
-            self.platforms.append(pygame.Rect(start_x - 20, SCREEN_HEIGHT - 40, pit_start - start_x + 20, 40))
-            for i in range(pit_width // 20):
-                self.spikes.append(pygame.Rect(pit_start + i * 20, SCREEN_HEIGHT - 40, 20, 20))
-            self.platforms.append(pygame.Rect(pit_start + pit_width, SCREEN_HEIGHT - 40, end_x - (pit_start + pit_width) + 20, 40))
-        elif chosen_pattern == 'slope_jump':
-            sx = start_x + random.randint(100, 200)
-            self.slopes.append(Slope(sx, SCREEN_HEIGHT - 120, 100, 100, SLOPE_COLOR, 100, 0))
-            if random.random() < 0.5:
-                self.platforms.append(pygame.Rect(sx + 200, SCREEN_HEIGHT - 200, 120, 20))
-        elif chosen_pattern == 'wall_climb':
-            wx = start_x + 150
-            self.walls_3d.append(pygame.Rect(wx, SCREEN_HEIGHT - 120, 20, 100))
-            self.walls_3d.append(pygame.Rect(wx + 200, SCREEN_HEIGHT - 220, 20, 100))
-            self.platforms.append(pygame.Rect(wx + 20, SCREEN_HEIGHT - 220, 180, 20))
-        self.last_generated_x = end_x
+        # Only the new chunk's objects go into the indexes; nothing already placed is re-indexed
+        chunk_id = next(self.chunks)
+        lists = {"platform": self.platforms, "spike": self.spikes, "wall_3d": self.walls_3d, "trampoline": self.trampolines, "slope": self.slopes}
+        added = []
+        for obj_type, x, y, w, h, left_top, right_top in self.library.chunk_objects(chunk_id):
+            obj = Slope(start_x + x, y, w, h, SLOPE_COLOR, left_top, right_top) if obj_type == "slope" else pygame.Rect(start_x + x, y, w, h)
+            lists[obj_type].append(obj)
+            added.append((obj_type, obj))
+        added.sort(key=lambda item: self.RENDER_ORDER[item[0]])
+        self.index_objects(added)
+        self.last_generated_x = start_x + self.library.chunk_info(chunk_id)[4]
     def update(self):
         super().update()
-        player_world_x = self.player.right - self.camera.camera.x
-        if player_world_x > self.last_generated_x:
-            self.last_generated_x += SCREEN_WIDTH * 0.75
+        if self.player.right + SCREEN_WIDTH > self.last_generated_x:
             self.generate_chunk(self.last_generated_x)
         despawn_line = self.player.centerx - SCREEN_WIDTH * 1.5
-        self.platforms = [p for p in self.platforms if p.right > despawn_line or p.height == 40]
-        self.pushable_objects = [o for o in self.pushable_objects if o.rect.right > despawn_line]
-        self.trampolines = [t for t in self.trampolines if t.right > despawn_line]
-        self.walls_3d = [w for w in self.walls_3d if w.right > despawn_line]
-        self.slopes = [s for s in self.slopes if s.rect.right > despawn_line]
-        self.spikes = [s for s in self.spikes if s.right > despawn_line]
+        despawned = [("slope", s) for s in self.slopes if s.rect.right <= despawn_line]
+        for obj_type, objects in (("platform", self.platforms), ("trampoline", self.trampolines), ("wall_3d", self.walls_3d), ("spike", self.spikes)):
+            despawned += [(obj_type, o) for o in objects if o.right <= despawn_line]
+        if despawned:
+            self.platforms = [p for p in self.platforms if p.right > despawn_line]
+            self.trampolines = [t for t in self.trampolines if t.right > despawn_line]
+            self.walls_3d = [w for w in self.walls_3d if w.right > despawn_line]
+            self.slopes = [s for s in self.slopes if s.rect.right > despawn_line]
+            self.spikes = [s for s in self.spikes if s.right > despawn_line]
+            self.unindex_objects(despawned)
 
 # --- Main Game Class ---
 class Game:
-    def __init__(self):
+    def __init__(self, spectator_port=None, infinite_seed=None):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("2D/3D Game")
         self.clock = pygame.time.Clock()
         self.is_running = True
+        self.level_saver = LevelSaver()
         self.static_camera = Camera(0,0)
+        self.spectators = None
+        if spectator_port is not None:
+            self.spectators = spectator_server.SpectatorServer(port=spectator_port)
+            try:
+                self.spectators.start_in_thread()
+            except OSError as e:
+                print(f"ERROR: Could not start spectator server on port {spectator_port}: {e}. Spectating is disabled.")
+                self.spectators = None
         self.states = {
             MENU: Menu(self),
             LEVEL_EDITOR: LevelEditor(self),
             LEVEL_SELECT: LevelSelect(self),
-            PLAYING_INFINITE: PlayingInfinite(self)
         }
+        self.infinite_seed = infinite_seed
         self.current_state_name = MENU
         self.current_state = self.states[self.current_state_name]
-    def change_state(self, new_state_name, level_data=None, filename=None):
+    def change_state(self, new_state_name, level_data=None, filename=None, seed=None):
+        # Infinite mode is only built when entered, with the given seed, else the --seed one, else a random one
+        if new_state_name == PLAYING_INFINITE:
+            self.states[PLAYING_INFINITE] = PlayingInfinite(self, seed=seed if seed is not None else self.infinite_seed)
         if new_state_name in self.states:
             if new_state_name == LEVEL_EDITOR:
                 self.states[LEVEL_EDITOR] = LevelEditor(self, level_data=level_data, filename=filename)
-            elif new_state_name in [PLAYING_INFINITE, LEVEL_SELECT]:
-                self.states[new_state_name] = type(self.states[new_state_name])(self)
+            elif new_state_name == LEVEL_SELECT:
+                self.states[LEVEL_SELECT] = LevelSelect(self)
             self.current_state = self.states[new_state_name]
             self.current_state_name = new_state_name
     def start_playing(self, level_data=None):
@@ -774,19 +1290,48 @@ class Game:
         self.change_state(PLAYING)
     def start_editing(self, level_data=None, filename=None):
         self.change_state(LEVEL_EDITOR, level_data=level_data, filename=filename)
+    def poll_events(self):
+        if self.current_state.is_animating: return pygame.event.get()
+        # Idle states block until input arrives; wait returns as soon as an event is queued, so input isn't delayed
+        event = pygame.event.wait(IDLE_WAIT_MS)
+        return ([event] if event.type != pygame.NOEVENT else []) + pygame.event.get()
     def run(self):
+        drawn = False
         while self.is_running:
-            events = pygame.event.get()
+            state = self.current_state
+            events = self.poll_events()
             for event in events:
                 if event.type == pygame.QUIT: self.is_running = False
             self.current_state.handle_events(events)
             self.current_state.update()
-            self.current_state.draw(self.screen)
-            pygame.display.flip()
+            if events or self.current_state.is_animating or self.current_state is not state or not drawn:
+                self.current_state.draw(self.screen)
+                pygame.display.flip()
+                drawn = True
             self.clock.tick(FPS)
+        self.level_saver.close()
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
-    game = Game()
+    # python 2d3dgame.py --spectate [port] publishes Playing sessions to local spectator/ghost clients
+    # python 2d3dgame.py --seed <n> replays the infinite mode run printed with that seed
+    spectator_port = None
+    if "--spectate" in sys.argv:
+        i = sys.argv.index("--spectate")
+        spectator_port = spectator_server.DEFAULT_PORT
+        if i + 1 < len(sys.argv) and not sys.argv[i + 1].startswith("--"):
+            if not sys.argv[i + 1].isdigit():
+                print(f"Invalid spectator port '{sys.argv[i + 1]}': expected a number, e.g. --spectate {spectator_server.DEFAULT_PORT}")
+                sys.exit(1)
+            spectator_port = int(sys.argv[i + 1])
+    infinite_seed = None
+    if "--seed" in sys.argv:
+        i = sys.argv.index("--seed")
+        try:
+            infinite_seed = int(sys.argv[i + 1])
+        except (IndexError, ValueError):
+            print("Invalid --seed: expected a number, e.g. --seed 12345")
+            sys.exit(1)
+    game = Game(spectator_port=spectator_port, infinite_seed=infinite_seed)
     game.run()
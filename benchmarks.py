@@ -0,0 +1,331 @@
+import os
+import sys
+import gc
+import time
+import tracemalloc
+import random
+import shutil
+import tempfile
+import asyncio
+import importlib.util
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+def load_game():
+    # The game module's filename starts with a digit, so it can't be imported by name
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2d3dgame.py")
+    spec = importlib.util.spec_from_file_location("game", path)
+    game = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(game)
+    return game
+
+def bench_memory(count=100000):
+    game = load_game()
+    makers = {
+        "platform": lambda i: game.GameObject(i * 20, 300, 100, 20, game.RED, "platform"),
+        "pushable": lambda i: game.PushableObject(i * 20, 300, 40, 40, game.PURPLE),
+        "slope": lambda i: game.Slope(i * 20, 300, 100, 100, game.SLOPE_COLOR, 100, 0),
+    }
+    print(f"Memory per object ({count} objects each):")
+    for name, make in makers.items():
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        objects = [make(i) for i in range(count)]
+        elapsed = time.perf_counter() - start
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {name:<10} {size / count:7.1f} bytes/object  {elapsed * 1e9 / count:7.0f} ns/object")
+        del objects
+
+class BenchGame:
+    spectators = None
+    def change_state(self, *args, **kwargs): pass
+
+class HeldKeys:
+    def __init__(self, *held): self.held = set(held)
+    def __getitem__(self, key): return key in self.held
+
+def frame_stats(times):
+    times = sorted(times)
+    return f"mean {sum(times) / len(times) * 1000:6.3f} ms  p99 {times[int(len(times) * 0.99)] * 1000:6.3f} ms"
+
+def crate_level(count):
+    level = ["start,100,500,40,50", "goal,3900,100,80,80", "platform,0,580,4000,20"]
+    for i in range(count):
+        level.append(f"pushable,{200 + (i % 40) * 90},{60 + (i // 40) * 50},40,40")
+    return level
+
+def bench_pushables(count=400, frames=600):
+    game = load_game()
+    import pygame
+    pygame.init()
+    playing = game.Playing(BenchGame(), level_data=crate_level(count))
+    playing.toggle_mode()
+    pygame.key.get_pressed = lambda: HeldKeys(pygame.K_k, pygame.K_RIGHT, pygame.K_DOWN)
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        playing.update()
+        times.append(time.perf_counter() - start)
+    print(f"Pushables ({count} crates, grabbing in 3D, {frames} frames): {frame_stats(times)}")
+
+def spike_level(count):
+    # Spike pits like generate_level's spike_trap runs, laid end to end over a raised floor
+    level = ["start,100,400,40,50", "goal,100000,100,80,80", "platform,0,460,100000,20"]
+    for i in range(count):
+        level.append(f"spike,{1000 + i * 20},580,20,20")
+    for i in range(count // 50):
+        level.append(f"checkpoint,{1000 + i * 1000},400,20,60")
+    return level
+
+def bench_triggers(frames=600):
+    game = load_game()
+    import pygame
+    pygame.init()
+    pygame.key.get_pressed = lambda: HeldKeys(pygame.K_RIGHT)
+    for count in (5, 5000):
+        playing = game.Playing(BenchGame(), level_data=spike_level(count))
+        times = []
+        for _ in range(frames):
+            start = time.perf_counter()
+            playing.update()
+            times.append(time.perf_counter() - start)
+        print(f"Triggers ({count} spikes, {frames} frames): {frame_stats(times)}")
+
+def bench_spectators(subscribers=100, seconds=5, pushables=200, fps=60):
+    import spectator_server
+    async def run():
+        server = spectator_server.SpectatorServer(port=0)
+        await server.start()
+        clients = [spectator_server.SpectatorClient() for _ in range(subscribers)]
+        tasks = [asyncio.ensure_future(c.run(port=server.port)) for c in clients]
+        while len(server.subscribers) < subscribers: await asyncio.sleep(0.01)
+        # Synthetic session: player running and jumping in 3D, one crate being pushed at a time
+        boxes = [[200 + i * 60, 540] for i in range(pushables)]
+        ticks = seconds * fps
+        full_bytes = 0
+        start = time.perf_counter()
+        for tick in range(ticks):
+            boxes[(tick // 120) % pushables][0] += 4
+            state = {"p": [100 + tick * 5, 540, 40, 40], "m": 1, "z": -abs(tick % 40 - 20), "vy": 0, "vz": 0.5, "b": [list(b) for b in boxes]}
+            full_bytes += len(spectator_server.encode_frame({"t": tick, "s": 0.0, "k": state}))
+            server.publish_now(state)
+            await asyncio.sleep(max(0, start + (tick + 1) / fps - time.perf_counter()))
+        await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - start
+        latencies = sorted(l for c in clients for l in c.latencies)
+        in_sync = sum(c.state == server.encoder.state for c in clients)
+        print(f"Spectators ({subscribers} subscribers, {pushables} pushables, {seconds}s at {fps} ticks/s):")
+        print(f"  sent {server.bytes_sent / elapsed / 1024:8.1f} KiB/s total, {server.bytes_sent / elapsed / subscribers:7.0f} B/s per subscriber")
+        print(f"  full state every tick would be {full_bytes * subscribers / elapsed / 1024:8.1f} KiB/s total")
+        print(f"  latency mean {sum(latencies) / len(latencies) * 1000:.2f} ms  p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+        print(f"  {in_sync}/{subscribers} subscribers in sync, {server.resyncs} backpressure resyncs")
+        for c in clients: c.close()
+        await server.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run(run())
+
+def bench_rewind(count=400, frames=3000):
+    game = load_game()
+    import pygame
+    pygame.init()
+    playing = game.Playing(BenchGame(), level_data=crate_level(count))
+    playing.toggle_mode()
+    pygame.key.get_pressed = lambda: HeldKeys(pygame.K_k, pygame.K_RIGHT, pygame.K_DOWN)
+    tracemalloc.start()
+    for frame in range(frames):
+        playing.update()
+        if frame % 1000 == 999: print(f"Rewind buffer after {frame + 1} ticks ({count} pushables): {len(playing.rewind)} entries, {tracemalloc.get_traced_memory()[0] / 1024:.0f} KiB traced")
+    tracemalloc.stop()
+    for ticks in (1, game.REWIND_SCRUB_TICKS, game.REWIND_KEYFRAME_INTERVAL + 1, len(playing.rewind) - 1):
+        buffer = game.RewindBuffer(playing.pushable_objects)
+        buffer.fields, buffer.entries, buffer.positions = playing.rewind.fields, game.deque(playing.rewind.entries), dict(playing.rewind.positions)
+        start = time.perf_counter()
+        buffer.rewind(ticks)
+        print(f"  rewind {ticks:3} ticks: {(time.perf_counter() - start) * 1e6:7.1f} us")
+
+def check_rewind(ticks=20000, seed=1):
+    # Plays random inputs over crates, spikes and a checkpoint, keeps every tick's state on the side and checks that
+    # rewinds of random length (scrubs, keyframe jumps, across deaths and evicted history) land exactly on the recorded state
+    game = load_game()
+    import pygame
+    pygame.init()
+    rng = random.Random(seed)
+    level = crate_level(40) + [f"spike,{600 + i * 400},560,20,20" for i in range(8)] + ["checkpoint,1000,500,20,60"]
+    playing = game.Playing(BenchGame(), level_data=level)
+    keys = HeldKeys()
+    pygame.key.get_pressed = lambda: keys
+    def state():
+        return playing.rewind_fields(), [obj.rect.topleft for obj in playing.pushable_objects]
+    history = []
+    rewinds = rewound = deaths = 0
+    for tick in range(ticks):
+        if rng.random() < 0.03:
+            n = rng.choice([1, game.REWIND_SCRUB_TICKS, rng.randint(1, game.REWIND_KEYFRAME_INTERVAL * 3), rng.randint(1, len(history) + 5)])
+            playing.rewind_step(n)
+            n = min(n, len(history) - 1)
+            if n > 0: del history[-n:]
+            expected = history[-1] if history else None
+            if expected and state() != expected:
+                print(f"Rewind check FAILED at tick {tick}: rewinding {n} ticks gave {state()[0]}, expected {expected[0]}")
+                sys.exit(1)
+            if any(playing.pushable_grid.rects[obj] != obj.rect for obj in playing.pushable_objects):
+                print(f"Rewind check FAILED at tick {tick}: pushable grid out of sync after rewinding {n} ticks")
+                sys.exit(1)
+            rewinds += 1
+            rewound += n
+            continue
+        if tick % 20 == 0: keys.held = {k for k in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_k) if rng.random() < 0.4}
+        events = [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_UP, unicode="")] if rng.random() < 0.05 else []
+        if rng.random() < 0.01: playing.toggle_mode()
+        start = playing.player.topleft
+        playing.handle_events(events)
+        playing.update()
+        if playing.player.topleft == playing.start_pos and start != playing.start_pos: deaths += 1
+        history.append(state())
+        if len(history) > len(playing.rewind) + 1: history.pop(0)
+    print(f"Rewind check ({ticks} ticks, {deaths} deaths): {rewinds} rewinds over {rewound} ticks matched the recorded history")
+
+def slope_terrain(segments):
+    # Rolling hills built from 20px slope segments chained end to end
+    level = ["start,100,300,40,50", "goal,1000000,100,80,80"]
+    heights = [400 + int(60 * ((i % 40) - 20) ** 2 / 400) for i in range(segments + 1)]
+    for i in range(segments):
+        top = min(heights[i], heights[i + 1])
+        level.append(f"slope,{i * 20},{top},20,{600 - top},{heights[i] - top},{heights[i + 1] - top}")
+    return level
+
+def bench_slopes(frames=600):
+    game = load_game()
+    import pygame
+    pygame.init()
+    pygame.key.get_pressed = lambda: HeldKeys(pygame.K_RIGHT)
+    for segments in (50, 5000):
+        playing = game.Playing(BenchGame(), level_data=slope_terrain(segments))
+        times = []
+        for _ in range(frames):
+            start = time.perf_counter()
+            playing.update()
+            times.append(time.perf_counter() - start)
+        print(f"Slopes ({segments} chained segments, walking in 2D, {frames} frames): {frame_stats(times)}")
+
+class CountingScreen:
+    # Forwards to the real screen, counting every blit/blits call and pygame.draw call aimed at it
+    def __init__(self, surface):
+        self.surface = surface
+        self.calls = 0
+    def blit(self, *args, **kwargs):
+        self.calls += 1
+        return self.surface.blit(*args, **kwargs)
+    def blits(self, *args, **kwargs):
+        self.calls += 1
+        return self.surface.blits(*args, **kwargs)
+    def __getattr__(self, name):
+        return getattr(self.surface, name)
+
+def count_draw_calls(pygame, screen):
+    for name in ("rect", "polygon", "line", "ellipse"):
+        def counted(surf, *args, _draw=getattr(pygame.draw, name), **kwargs):
+            if surf is screen:
+                screen.calls += 1
+                surf = screen.surface
+            return _draw(surf, *args, **kwargs)
+        setattr(pygame.draw, name, counted)
+
+def editor_level(count, seed=1):
+    rng = random.Random(seed)
+    level = ["start,100,530,40,50", "goal,3900,100,80,80"]
+    for _ in range(count):
+        x, y = rng.randrange(0, 20000, 20), rng.randrange(100, 560, 20)
+        kind = rng.choice(["platform", "spike", "slope", "pushable", "wall_3d"])
+        if kind == "slope": level.append(f"slope,{x},{y},100,100,100,0")
+        elif kind == "spike": level.append(f"spike,{x},{y},20,20")
+        else: level.append(f"{kind},{x},{y},{rng.choice([20, 40, 100])},20")
+    return level
+
+def bench_render(frames=300):
+    game = load_game()
+    import pygame
+    pygame.init()
+    screen = CountingScreen(pygame.display.set_mode((game.SCREEN_WIDTH, game.SCREEN_HEIGHT)))
+    count_draw_calls(pygame, screen)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels", "trapped in a box.txt")) as f: boxed = f.readlines()
+    cases = [
+        ("play 'trapped in a box'", game.Playing(BenchGame(), level_data=boxed), HeldKeys(pygame.K_RIGHT)),
+        ("play 400 crates, pushing", game.Playing(BenchGame(), level_data=crate_level(400)), HeldKeys(pygame.K_k, pygame.K_RIGHT, pygame.K_DOWN)),
+        ("editor 20000 objects, scrolling", game.LevelEditor(BenchGame(), level_data=editor_level(20000)), HeldKeys(pygame.K_RIGHT)),
+    ]
+    cases[1][1].toggle_mode()
+    for name, state, keys in cases:
+        pygame.key.get_pressed = lambda: keys
+        times, calls = [], 0
+        for _ in range(frames):
+            state.update()
+            screen.calls = 0
+            start = time.perf_counter()
+            state.draw(screen)
+            times.append(time.perf_counter() - start)
+            calls += screen.calls
+        print(f"Render {name} ({frames} frames): {frame_stats(times)}  {calls / frames:7.1f} draw calls/frame")
+
+def bench_save(count=100000):
+    game = load_game()
+    import pygame
+    pygame.init()
+    screen = pygame.display.set_mode((game.SCREEN_WIDTH, game.SCREEN_HEIGHT))
+    pygame.key.get_pressed = lambda: HeldKeys(pygame.K_RIGHT)
+    bench = BenchGame()
+    bench.level_saver = game.LevelSaver()
+    editor = game.LevelEditor(bench, level_data=editor_level(count))
+    def frame():
+        start = time.perf_counter()
+        editor.update()
+        editor.draw(screen)
+        return time.perf_counter() - start
+    editor.draw(screen)
+    idle = [frame() for _ in range(60)]
+    cwd, tmp = os.getcwd(), tempfile.mkdtemp()
+    os.chdir(tmp)
+    try:
+        start = time.perf_counter()
+        editor.save_level("big")
+        queued = time.perf_counter() - start
+        saver = bench.level_saver
+        times = []
+        while saver.pending or saver.busy: times.append(frame())
+        saver.flush()
+        elapsed = time.perf_counter() - start
+        # The thumbnail renders in a low-priority process, so it only gets the CPU the editor leaves; sample a few seconds of it
+        rendering = []
+        while len(rendering) < 120 and any(job.poll() is None for job in saver.thumbnail_jobs.values()): rendering.append(frame())
+        start = time.perf_counter()
+        saver.close()
+        print(f"Save ({count} objects): {queued * 1000:.2f} ms on the editor thread, written in the background in {elapsed * 1000:.0f} ms")
+        print(f"  editor frames, scrolling, before the save: {frame_stats(idle)}")
+        print(f"  editor frames during the save ({len(times)}): {frame_stats(times)}")
+        print(f"  editor frames while the thumbnail renders ({len(rendering)}): {frame_stats(rendering)}, then {(time.perf_counter() - start) * 1000:.0f} ms to finish it with the editor idle")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+BENCHMARKS = {
+    "memory": bench_memory,
+    "pushables": bench_pushables,
+    "triggers": bench_triggers,
+    "spectators": bench_spectators,
+    "rewind": bench_rewind,
+    "rewind_check": check_rewind,
+    "slopes": bench_slopes,
+    "render": bench_render,
+    "save": bench_save,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'. Available: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        BENCHMARKS[name]()
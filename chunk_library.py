@@ -0,0 +1,235 @@
+import os
+import sys
+import random
+import struct
+from array import array
+from collections import defaultdict
+
+LIBRARY_FILE = "chunks.bin"
+MAGIC = b"CHNK"
+VERSION = 1
+HEADER = struct.Struct("<4sHI") # magic, version, chunk count
+CHUNK_FIELDS = 6 # pattern, difficulty, entry_y, exit_y, width, object count
+OBJECT_FIELDS = 7 # type, x, y, w, h, left_top, right_top
+
+SCREEN_HEIGHT = 600
+CHUNK_WIDTH = 768
+FLOOR_HEIGHT = 40
+GROUND_LEVELS = (SCREEN_HEIGHT - 40, SCREEN_HEIGHT - 100, SCREEN_HEIGHT - 160) # floor tops a chunk can enter or exit at
+START_LEVEL = GROUND_LEVELS[0]
+PATTERNS = ("flat_gap", "platforms", "spike_pit", "slope_jump", "wall_climb")
+TYPES = ("platform", "spike", "slope", "wall_3d", "trampoline")
+DIFFICULTY_RAMP = 4 # chunks per difficulty step in a run
+
+# Same numbers as the game's physics, used to check every hop in a chunk can actually be made
+GRAVITY = 0.5
+JUMP_STRENGTH = -11
+RUN_SPEED = 5
+REACH_MARGIN = 0.85
+
+def jump_reach(rise):
+    # Horizontal distance covered by a jump that lands `rise` pixels higher (negative: lower), or 0 if it can't get that high
+    x, y, vel_y, peak = 0, 0, JUMP_STRENGTH, 0
+    while True:
+        vel_y += GRAVITY
+        y += vel_y
+        x += RUN_SPEED
+        peak = min(peak, y)
+        if vel_y > 0 and y >= -rise:
+            return x if peak <= -rise else 0
+        if y > SCREEN_HEIGHT: return 0
+
+def surfaces(objects):
+    # Standing surfaces as (left, right, top); a slope counts as a surface from its low end to its high end
+    found = []
+    for obj_type, x, y, w, h, left_top, right_top in objects:
+        if obj_type in ("platform", "wall_3d", "trampoline"): found.append((x, x + w, y))
+        elif obj_type == "slope": found.append((x, x + w, y + min(left_top, right_top)))
+    return found
+
+def validate_chunk(chunk):
+    pattern, entry_y, exit_y, width, objects = chunk
+    for obj_type, x, y, w, h, left_top, right_top in objects:
+        if x < 0 or x + w > width or y < 100 or y + h > SCREEN_HEIGHT: return False
+    spikes = [(x, x + w, y) for obj_type, x, y, w, h, lt, rt in objects if obj_type == "spike"]
+    # Spikes only belong in pits, never on something the player has to stand on
+    floors = surfaces(objects)
+    for left, right, top in floors:
+        if any(s_left < right and s_right > left and top <= s_top < top + FLOOR_HEIGHT for s_left, s_right, s_top in spikes): return False
+    start = [f for f in floors if f[0] == 0 and f[2] == entry_y]
+    goal = [f for f in floors if f[1] == width and f[2] == exit_y]
+    if not start or not goal: return False
+    reached, frontier = set(start), list(start)
+    while frontier:
+        left, right, top = frontier.pop()
+        for other in floors:
+            if other in reached: continue
+            gap = max(0, other[0] - right, left - other[1])
+            reach = jump_reach(top - other[2])
+            if reach and gap <= reach * REACH_MARGIN:
+                reached.add(other)
+                frontier.append(other)
+    return any(g in reached for g in goal)
+
+def chunk_difficulty(chunk):
+    pattern, entry_y, exit_y, width, objects = chunk
+    floors = sorted(surfaces(objects))
+    hardest = 0
+    for a, b in zip(floors, floors[1:]):
+        gap = b[0] - a[1]
+        if gap > 0:
+            reach = jump_reach(a[2] - b[2])
+            hardest = max(hardest, gap / reach if reach else 1)
+    spikes = sum(1 for obj in objects if obj[0] == "spike")
+    score = hardest + spikes * 0.02
+    return 0 if score < 0.45 else 1 if score < 0.7 else 2
+
+def floor(x, right, top):
+    return ("platform", x, top, right - x, FLOOR_HEIGHT, 0, 0)
+
+def build_chunk(rng, pattern, entry_y):
+    width = CHUNK_WIDTH
+    neighbours = [level for level in GROUND_LEVELS if abs(level - entry_y) <= 60]
+    objects = []
+    exit_y = entry_y
+    if pattern == "flat_gap":
+        exit_y = rng.choice(neighbours)
+        gap_start = rng.randint(150, 400)
+        gap_end = gap_start + rng.randint(60, 200)
+        objects += [floor(0, gap_start, entry_y), floor(gap_end, width, exit_y)]
+    elif pattern == "platforms":
+        exit_y = rng.choice(neighbours)
+        x = rng.randint(100, 200)
+        objects.append(floor(0, x, entry_y))
+        y = entry_y
+        while x < width - 250:
+            x += rng.randint(60, 180)
+            y = max(200, min(entry_y + 40, y + rng.randint(-90, 60)))
+            w = rng.randint(80, 150)
+            objects.append(("platform", x, y, w, 20, 0, 0))
+            x += w
+        objects.append(floor(min(x + rng.randint(40, 150), width - 80), width, exit_y))
+    elif pattern == "spike_pit":
+        pit_start = rng.randint(150, 300)
+        pit_width = rng.randrange(60, 220, 20)
+        objects += [floor(0, pit_start, entry_y), floor(pit_start + pit_width, width, exit_y)]
+        for i in range(pit_width // 20):
+            objects.append(("spike", pit_start + i * 20, entry_y, 20, 20, 0, 0))
+    elif pattern == "slope_jump":
+        exit_y = rng.choice([level for level in neighbours if level != entry_y] or [entry_y])
+        sx = rng.randint(100, 300)
+        rise = entry_y - exit_y
+        objects.append(floor(0, sx, entry_y))
+        if rise > 0: objects.append(("slope", sx, exit_y, 100, rise, rise, 0))
+        elif rise < 0: objects.append(("slope", sx, entry_y, 100, -rise, 0, -rise))
+        gap = rng.randint(0, 160) if rng.random() < 0.5 else 0
+        objects.append(floor(sx + 100 + gap, width, exit_y))
+        if rng.random() < 0.5: objects.append(("platform", sx + 200 + gap, exit_y - 100, 120, 20, 0, 0))
+    elif pattern == "wall_climb":
+        wx = rng.randint(120, 250)
+        objects.append(floor(0, width, entry_y))
+        objects.append(("wall_3d", wx, entry_y - 100, 20, 100, 0, 0))
+        objects.append(("wall_3d", wx + 200, entry_y - 200, 20, 100, 0, 0))
+        objects.append(("platform", wx + 20, entry_y - 100, 180, 20, 0, 0))
+        if rng.random() < 0.5: objects.append(("trampoline", wx + 300, entry_y - 20, 80, 20, 0, 0))
+    return (pattern, entry_y, exit_y, width, objects)
+
+def generate_library(count, seed=0):
+    rng = random.Random(seed)
+    chunks = []
+    attempts = 0
+    while len(chunks) < count:
+        attempts += 1
+        pattern = PATTERNS[attempts % len(PATTERNS)]
+        chunk = build_chunk(rng, pattern, rng.choice(GROUND_LEVELS))
+        if validate_chunk(chunk): chunks.append(chunk)
+    print(f"Generated {len(chunks)} chunks ({attempts - len(chunks)} rejected by validation)")
+    return chunks
+
+def pack_library(chunks):
+    # Packs chunks into the two native-order int16 arrays a ChunkLibrary reads from
+    table, objects = array('h'), array('h')
+    for chunk in chunks:
+        pattern, entry_y, exit_y, width, chunk_objects = chunk
+        table.extend((PATTERNS.index(pattern), chunk_difficulty(chunk), entry_y, exit_y, width, len(chunk_objects)))
+        for obj_type, *values in chunk_objects: objects.extend([TYPES.index(obj_type)] + values)
+    return table, objects
+
+def save_library(chunks, path=LIBRARY_FILE):
+    table, objects = pack_library(chunks)
+    if sys.byteorder == "big":
+        table.byteswap()
+        objects.byteswap()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(chunks)))
+        f.write(table.tobytes())
+        f.write(objects.tobytes())
+
+class ChunkLibrary:
+    # Chunks stay packed in two int16 arrays; objects are only unpacked when a chunk is placed
+    def __init__(self, table, objects):
+        self.table = table
+        self.objects = objects
+        self.offsets = []
+        self.index = defaultdict(list) # (pattern, difficulty, entry_y, exit_y) -> chunk ids
+        self.by_entry = defaultdict(list) # (entry_y, difficulty) -> chunk ids, what stitching looks up
+        offset = 0
+        for chunk_id in range(len(table) // CHUNK_FIELDS):
+            pattern, difficulty, entry_y, exit_y, width, count = self.chunk_info(chunk_id)
+            self.offsets.append(offset)
+            offset += count * OBJECT_FIELDS
+            self.index[(PATTERNS[pattern], difficulty, entry_y, exit_y)].append(chunk_id)
+            self.by_entry[(entry_y, difficulty)].append(chunk_id)
+    @classmethod
+    def load(cls, path=LIBRARY_FILE):
+        with open(path, "rb") as f: data = f.read()
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION: raise ValueError(f"{path} is not a version {VERSION} chunk library")
+        table_end = HEADER.size + count * CHUNK_FIELDS * 2
+        table, objects = array('h'), array('h')
+        table.frombytes(data[HEADER.size:table_end])
+        objects.frombytes(data[table_end:])
+        if sys.byteorder == "big":
+            table.byteswap()
+            objects.byteswap()
+        return cls(table, objects)
+    def __len__(self):
+        return len(self.offsets)
+    def chunk_info(self, chunk_id):
+        start = chunk_id * CHUNK_FIELDS
+        return tuple(self.table[start:start + CHUNK_FIELDS])
+    def chunk_objects(self, chunk_id):
+        count = self.table[chunk_id * CHUNK_FIELDS + 5]
+        start = self.offsets[chunk_id]
+        for i in range(start, start + count * OBJECT_FIELDS, OBJECT_FIELDS):
+            yield (TYPES[self.objects[i]],) + tuple(self.objects[i + 1:i + OBJECT_FIELDS])
+    def stitch(self, seed):
+        # Endless sequence of chunk ids for a run; each chunk enters at the height the previous one exited, and difficulty ramps up
+        rng = random.Random(seed)
+        exit_y, n = START_LEVEL, 0
+        while True:
+            wanted = min(2, n // DIFFICULTY_RAMP)
+            candidates = next((self.by_entry[(exit_y, d)] for d in sorted(range(3), key=lambda d: abs(d - wanted)) if self.by_entry.get((exit_y, d))), None)
+            if not candidates: raise ValueError(f"No chunks enter at height {exit_y}")
+            chunk_id = rng.choice(candidates)
+            exit_y = self.table[chunk_id * CHUNK_FIELDS + 3]
+            n += 1
+            yield chunk_id
+
+_library = None
+def load_library(path=LIBRARY_FILE):
+    global _library
+    if _library is None:
+        if os.path.exists(path):
+            _library = ChunkLibrary.load(path)
+        else:
+            print(f"{path} not found, generating chunks in memory (run 'python chunk_library.py' to build it)")
+            _library = ChunkLibrary(*pack_library(generate_library(500)))
+    return _library
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    save_library(generate_library(count))
+    library = ChunkLibrary.load()
+    for key in sorted(library.by_entry): print(f"  entry {key[0]} difficulty {key[1]}: {len(library.by_entry[key])} chunks")
+    print(f"Saved {len(library)} chunks to {LIBRARY_FILE} ({os.path.getsize(LIBRARY_FILE)} bytes)")
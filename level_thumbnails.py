@@ -0,0 +1,108 @@
+import os
+import sys
+import hashlib
+import tempfile
+from multiprocessing import Pool
+import pygame
+
+LEVELS_DIR = "levels"
+CACHE_DIR = os.path.join(LEVELS_DIR, ".thumbs")
+THUMB_SIZE = (160, 50)
+MIN_WORLD_WIDTH = 1024
+WORLD_HEIGHT = 600
+
+# Same colors the game uses for each object type
+COLORS = {
+    "start": (0, 255, 0),
+    "goal": (255, 255, 0),
+    "platform": (255, 0, 0),
+    "ground": (170, 170, 170),
+    "pushable": (128, 0, 128),
+    "trampoline": (0, 150, 150),
+    "wall_3d": (100, 100, 255),
+    "v_wall": (100, 100, 255),
+    "slope": (255, 165, 0),
+    "spike": (100, 100, 100),
+    "checkpoint": (100, 255, 100),
+}
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+def thumbnail_path(digest, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{digest}.png")
+
+def render_thumbnail(level_lines):
+    objects = []
+    for line in level_lines:
+        parts = line.strip().split(',')
+        if len(parts) < 5 or parts[0] not in COLORS: continue
+        objects.append((parts[0], tuple(map(int, parts[1:]))))
+    world_width = max([MIN_WORLD_WIDTH] + [data[0] + data[2] for _, data in objects])
+    scale = min(THUMB_SIZE[0] / world_width, THUMB_SIZE[1] / WORLD_HEIGHT)
+    surf = pygame.Surface(THUMB_SIZE)
+    surf.fill((255, 255, 255))
+    pygame.draw.rect(surf, COLORS["ground"], (0, int((WORLD_HEIGHT - 20) * scale), THUMB_SIZE[0], max(1, int(20 * scale))))
+    for obj_type, data in objects:
+        x, y, w, h = (v * scale for v in data[:4])
+        color = COLORS[obj_type]
+        if obj_type == "slope":
+            left_top, right_top = data[4] * scale, data[5] * scale
+            pygame.draw.polygon(surf, color, [(x, y + left_top), (x + w, y + right_top), (x + w, y + h), (x, y + h)])
+        elif obj_type == "spike":
+            pygame.draw.polygon(surf, color, [(x, y + h), (x + w / 2, y), (x + w, y + h)])
+        else:
+            pygame.draw.rect(surf, color, (int(x), int(y), max(1, int(w)), max(1, int(h))))
+    return surf
+
+def update_thumbnail(level_path, cache_dir=CACHE_DIR):
+    # Cached by content hash, so only levels whose contents changed get re-rendered
+    with open(level_path, 'rb') as f: data = f.read()
+    path = thumbnail_path(content_hash(data), cache_dir)
+    if not os.path.exists(path):
+        if not os.path.exists(cache_dir): os.makedirs(cache_dir, exist_ok=True)
+        surf = render_thumbnail(data.decode().splitlines())
+        # Unique temp name, since the level list and the editor's save thread can render the same level at once
+        fd, tmp_path = tempfile.mkstemp(suffix=".png", dir=cache_dir)
+        os.close(fd)
+        try:
+            pygame.image.save(surf, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return path
+
+def load_thumbnail(level_path, cache_dir=CACHE_DIR):
+    return pygame.image.load(update_thumbnail(level_path, cache_dir))
+
+def try_update_thumbnail(level_path, cache_dir=CACHE_DIR):
+    # Pool worker: a bad level is reported back instead of failing the whole batch
+    try:
+        return update_thumbnail(level_path, cache_dir), None
+    except (OSError, ValueError, UnicodeDecodeError, pygame.error) as e:
+        return None, f"{level_path}: {e}"
+
+def render_all(levels_dir=LEVELS_DIR, cache_dir=CACHE_DIR, workers=None):
+    level_paths = [os.path.join(levels_dir, f) for f in sorted(os.listdir(levels_dir)) if f.endswith(".txt")]
+    cached_before = set(os.listdir(cache_dir)) if os.path.exists(cache_dir) else set()
+    with Pool(workers) as pool:
+        results = pool.starmap(try_update_thumbnail, [(p, cache_dir) for p in level_paths], chunksize=16)
+    errors = [error for _, error in results if error]
+    for error in errors: print(f"Skipped {error}")
+    in_use = {os.path.basename(p) for p, _ in results if p}
+    # Drop thumbnails of levels that have since been edited or removed
+    for name in cached_before - in_use:
+        if name.endswith(".png"): os.remove(os.path.join(cache_dir, name))
+    print(f"{len(in_use - cached_before)} rendered, {len(in_use & cached_before)} cached, {len(cached_before - in_use)} pruned, {len(errors)} failed")
+
+if __name__ == "__main__":
+    # Batch rendering never opens a window; only set when run as a script so importing this module leaves SDL alone
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    target = sys.argv[1] if len(sys.argv) > 1 else LEVELS_DIR
+    if target.endswith(".txt"):
+        # A single level, as the editor runs it after each save
+        _, error = try_update_thumbnail(target, os.path.join(os.path.dirname(target), ".thumbs"))
+        if error: print(f"Could not update thumbnail for {error}")
+    else:
+        render_all(target, os.path.join(target, ".thumbs"))
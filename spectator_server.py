@@ -0,0 +1,154 @@
+import sys
+import json
+import time
+import asyncio
+import threading
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+KEYFRAME_INTERVAL = 60 # ticks between full snapshots
+BATCH_TICKS = 2 # ticks of frames coalesced into one write per subscriber
+HIGH_WATER = 64 * 1024 # bytes buffered for a subscriber before it is skipped and resynced with a keyframe
+
+# State is a flat dict of fields plus "b", the list of pushable positions. Deltas carry only changed fields and moved pushables.
+def diff_state(prev, state):
+    delta = {k: v for k, v in state.items() if k != "b" and prev.get(k) != v}
+    moved = {i: pos for i, pos in enumerate(state["b"]) if prev["b"][i] != pos}
+    if moved: delta["b"] = moved
+    return delta
+
+def apply_delta(state, delta):
+    for k, v in delta.items():
+        if k == "b":
+            for i, pos in v.items(): state["b"][int(i)] = pos
+        else:
+            state[k] = v
+
+def encode_frame(frame):
+    return (json.dumps(frame, separators=(",", ":")) + "\n").encode()
+
+class SnapshotEncoder:
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.tick = 0
+        self.state = None
+    def encode(self, state):
+        self.tick += 1
+        prev, self.state = self.state, state
+        if prev is None or self.tick % self.keyframe_interval == 0 or len(prev["b"]) != len(state["b"]):
+            return self.keyframe()
+        delta = diff_state(prev, state)
+        if not delta: return b""
+        return encode_frame({"t": self.tick, "s": time.time(), "d": delta})
+    def keyframe(self):
+        return encode_frame({"t": self.tick, "s": time.time(), "k": self.state})
+
+class SpectatorServer:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, batch_ticks=BATCH_TICKS):
+        self.host, self.port = host, port
+        self.batch_ticks = batch_ticks
+        self.encoder = SnapshotEncoder()
+        self.subscribers = {} # writer -> needs a keyframe before it can apply deltas
+        self.pending = []
+        self.bytes_sent = 0
+        self.resyncs = 0
+        self.loop = None
+        self.server = None
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_subscriber, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+    async def stop(self):
+        for writer in list(self.subscribers): writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+    async def handle_subscriber(self, reader, writer):
+        self.subscribers[writer] = True
+        try:
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.pop(writer, None)
+            writer.close()
+    def publish_now(self, state):
+        frame = self.encoder.encode(state)
+        if frame: self.pending.append(frame)
+        if self.encoder.tick % self.batch_ticks == 0: self.flush()
+    def flush(self):
+        batch = b"".join(self.pending)
+        self.pending.clear()
+        keyframe = None
+        for writer, needs_keyframe in list(self.subscribers.items()):
+            if writer.is_closing(): continue
+            if writer.transport.get_write_buffer_size() > HIGH_WATER:
+                # Slow subscriber: drop its deltas rather than buffering without bound, and resync it once it drains
+                if not needs_keyframe: self.resyncs += 1
+                self.subscribers[writer] = True
+                continue
+            if needs_keyframe:
+                if self.encoder.state is None: continue
+                keyframe = keyframe or self.encoder.keyframe()
+                data = keyframe
+                self.subscribers[writer] = False
+            else:
+                data = batch
+            if data:
+                writer.write(data)
+                self.bytes_sent += len(data)
+    # Playing runs on the pygame thread, so the server gets its own event loop thread and states are handed over with call_soon_threadsafe
+    def start_in_thread(self):
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+        def run():
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.start())
+            except Exception as e:
+                errors.append(e)
+                return
+            finally:
+                started.set()
+            self.loop.run_forever()
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        if errors:
+            # Startup failures (e.g. port already in use) are raised to the caller instead of leaving it waiting
+            self.loop.close()
+            raise errors[0]
+        print(f"Spectator server listening on {self.host}:{self.port}")
+    def publish(self, state):
+        self.loop.call_soon_threadsafe(self.publish_now, state)
+
+class SpectatorClient:
+    def __init__(self):
+        self.state = None
+        self.bytes_received = 0
+        self.latencies = []
+        self.writer = None
+    async def run(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        while True:
+            line = await reader.readline()
+            if not line: break
+            self.bytes_received += len(line)
+            frame = json.loads(line)
+            self.latencies.append(time.time() - frame["s"])
+            if "k" in frame: self.state = frame["k"]
+            elif self.state is not None: apply_delta(self.state, frame["d"])
+    def close(self):
+        if self.writer: self.writer.close()
+
+if __name__ == "__main__":
+    # Ghost client: prints the player position as it is received
+    if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+        print(f"Invalid port '{sys.argv[1]}': expected a number")
+        sys.exit(1)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    async def watch():
+        client = SpectatorClient()
+        task = asyncio.ensure_future(client.run(port=port))
+        while not task.done():
+            await asyncio.sleep(0.5)
+            if client.state: print(f"player {client.state['p']} mode {'3D' if client.state['m'] else '2D'} z {client.state['z']}")
+    asyncio.run(watch())